@@ -25,69 +25,93 @@ logger = logging.getLogger('main')
 
 def db_export_fuzzy_meta(con, output, limit=0, threshold=0.8):
     """
-    Exports meta data matches to CSV. Uses CSV delimiter "|".
+    Exports meta data matches to CSV. Uses CSV delimiter "|". Only the best
+    match of each DNB record is exported.
     """
     query = """
-        SELECT
-            dnb_meta.dnb_id      AS DnbId,
-            dnb_meta.pref_name   AS DnbPrefName,
-            gaz_ident_gnd.gnd_id AS GazGnd,
-            gaz_meta.pref_title  AS GazPrefTitle,
-            fuzzy_meta.jarow     AS Threshold
-        FROM
-            fuzzy_meta
-        INNER JOIN dnb_meta      ON dnb_meta.id = fuzzy_meta.dnb_meta_id
-        INNER JOIN gaz_meta      ON gaz_meta.id = fuzzy_meta.gaz_meta_id
-        INNER JOIN gaz_ident_gnd ON gaz_ident_gnd.gaz_id = gaz_meta.gaz_id
-        WHERE Threshold >= {:f}
-        GROUP BY dnb_meta.dnb_id
+        SELECT DnbId, DnbPrefName, GazGnd, GazPrefTitle, Threshold FROM (
+            SELECT
+                dnb_meta.dnb_id      AS DnbId,
+                dnb_meta.pref_name   AS DnbPrefName,
+                gaz_ident_gnd.gnd_id AS GazGnd,
+                gaz_meta.pref_title  AS GazPrefTitle,
+                fuzzy_meta.jarow     AS Threshold,
+                row_number() OVER (
+                    PARTITION BY fuzzy_meta.dnb_meta_id
+                    ORDER BY fuzzy_meta.jarow DESC, fuzzy_meta.id ASC, gaz_ident_gnd.id ASC
+                ) AS Rank
+            FROM
+                fuzzy_meta
+            INNER JOIN dnb_meta      ON dnb_meta.id = fuzzy_meta.dnb_meta_id
+            INNER JOIN gaz_meta      ON gaz_meta.id = fuzzy_meta.gaz_meta_id
+            INNER JOIN gaz_ident_gnd ON gaz_ident_gnd.gaz_id = gaz_meta.gaz_id
+            WHERE fuzzy_meta.jarow >= {:f}
+        )
+        WHERE Rank = 1
     """.format(threshold)
 
     if limit > 0: query += " LIMIT {:d}".format(limit)
 
     cur = con.cursor()
-    data = cur.execute(query)
+    cur.arraysize = 10000
+    cur.execute(query)
 
-    with open(output, 'w') as f:
-        writer = csv.writer(f, delimiter='|')
+    with open(output, 'w', newline='', buffering=1 << 20, encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='|', quoting=csv.QUOTE_MINIMAL)
         writer.writerow(['#DNB ID', 'DNB Pref Name', 'Gaz GND ID', 'Gaz Pref Name', 'Threshold'])
-        writer.writerows(data)
+
+        while True:
+            rows = cur.fetchmany()
+            if not rows: break
+            writer.writerows(rows)
 
 
 def db_export_fuzzy_names(con, output, limit=0, threshold=0.8):
     """
-    Exports name matches to CSV. Uses CSV delimiter "|".
+    Exports name matches to CSV. Uses CSV delimiter "|". Only the best
+    match of each DNB record is exported.
     """
     query = """
-        SELECT
-            dnb_meta.dnb_id      AS DnbId,
-            dnb_meta.pref_name   AS DnbPrefName,
-            dnb_name.var_name    AS DnbName,
-            gaz_ident_gnd.gnd_id AS GazGndId,
-            gaz_meta.pref_title  AS GazPrefTitle,
-            gaz_name.title       AS GazTitle,
-            fuzzy_name.jarow     AS Threshold
-        FROM
-            fuzzy_name
-        INNER JOIN dnb_name      ON dnb_name.id = fuzzy_name.dnb_name_id
-        INNER JOIN gaz_name      ON gaz_name.id = fuzzy_name.gaz_name_id
-        INNER JOIN dnb_meta      ON dnb_meta.id = dnb_name.dnb_meta_id
-        INNER JOIN gaz_meta      ON gaz_meta.gaz_id = gaz_name.gaz_id
-        INNER JOIN gaz_ident_gnd ON gaz_ident_gnd.gaz_id = gaz_meta.gaz_id
-        WHERE Threshold > {:f}
-        GROUP BY dnb_meta.dnb_id
+        SELECT DnbId, DnbPrefName, DnbName, GazGndId, GazPrefTitle, GazTitle, Threshold FROM (
+            SELECT
+                dnb_meta.dnb_id      AS DnbId,
+                dnb_meta.pref_name   AS DnbPrefName,
+                dnb_name.var_name    AS DnbName,
+                gaz_ident_gnd.gnd_id AS GazGndId,
+                gaz_meta.pref_title  AS GazPrefTitle,
+                gaz_name.title       AS GazTitle,
+                fuzzy_name.jarow     AS Threshold,
+                row_number() OVER (
+                    PARTITION BY dnb_name.dnb_meta_id
+                    ORDER BY fuzzy_name.jarow DESC, fuzzy_name.id ASC, gaz_meta.id ASC, gaz_ident_gnd.id ASC
+                ) AS Rank
+            FROM
+                fuzzy_name
+            INNER JOIN dnb_name      ON dnb_name.id = fuzzy_name.dnb_name_id
+            INNER JOIN gaz_name      ON gaz_name.id = fuzzy_name.gaz_name_id
+            INNER JOIN dnb_meta      ON dnb_meta.id = dnb_name.dnb_meta_id
+            INNER JOIN gaz_meta      ON gaz_meta.gaz_id = gaz_name.gaz_id
+            INNER JOIN gaz_ident_gnd ON gaz_ident_gnd.gaz_id = gaz_meta.gaz_id
+            WHERE fuzzy_name.jarow > {:f}
+        )
+        WHERE Rank = 1
     """.format(threshold)
 
     if limit > 0: query += " LIMIT {:d}".format(limit)
 
     cur = con.cursor()
-    data = cur.execute(query)
+    cur.arraysize = 10000
+    cur.execute(query)
 
-    with open(output, 'w') as f:
-        writer = csv.writer(f, delimiter='|')
+    with open(output, 'w', newline='', buffering=1 << 20, encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='|', quoting=csv.QUOTE_MINIMAL)
         writer.writerow(['#DNB ID', 'DNB Pref Name', 'DNB Name', 'Gaz GND ID', \
                          'Gaz Pref Title', 'Gaz Title', 'Threshold'])
-        writer.writerows(data)
+
+        while True:
+            rows = cur.fetchmany()
+            if not rows: break
+            writer.writerows(rows)
 
 
 def db_open(db_path):
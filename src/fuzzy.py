@@ -9,68 +9,258 @@ Usage:
 $ python3 fuzzy.py --help
 $ python3 fuzzy.py --input database.sqlite --meta
 $ python3 fuzzy.py --input database.sqlite --names --threshold 0.9
+$ python3 fuzzy.py --input database.sqlite --meta --jobs 4
 ```
 """
 
 import logging
+import multiprocessing
+import os
 import sqlite3
 import sys
 
 from argparse import ArgumentParser, FileType
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 logger = logging.getLogger('main')
 
+# Number of parts the DNB data is split into for parallel matching.
+FUZZY_SHARDS = 256
+
+# Tables and their transliterated name columns used for blocking. Columns and
+# indices are added by `db_init()` to databases created with older schemas.
+BLOCK_COLUMNS = {
+    'dnb_meta': 'pref_name_tl',
+    'dnb_name': 'var_name_tl',
+    'gaz_meta': 'pref_title_tl',
+    'gaz_name': 'title_tl',
+}
+
+# Fuzzy matching queries. Parameters `:shards` and `:shard` select the part of
+# the DNB data to match, `:threshold` is the minimum Jaro-Winkler distance.
+# Empty names are skipped. The join selects all pairs whose blocking keys agree
+# on their common length, i.e., either the Gazetteer key starts with the DNB
+# key (range on the index), or it is one of the shorter prefixes of the DNB key.
+#
+# Pairs whose length ratio rules out the threshold are scored NULL in the CASE
+# expression, before jaro_winkler() would be called. With m matching characters,
+# m <= min_len, the Jaro distance is at most (2 + min_len / max_len) / 3, and the
+# Winkler bonus (scaling factor 0.1, prefix of up to four characters) at most
+# 0.4 * (1 - Jaro). Hence, Jaro-Winkler is at most 0.8 + 0.2 * min_len / max_len,
+# and min_len / max_len >= 5 * threshold - 4 is necessary. This assumes the
+# standard definition of the sqlean function, and that transliterated names
+# consist of single-byte characters. No pair is skipped for thresholds <= 0.8.
+SQL_SELECT_FUZZY_META = """
+    SELECT dnb_meta_id, gaz_meta_id, jw FROM (
+        SELECT
+            dnb_meta.id AS dnb_meta_id,
+            gaz_meta.id AS gaz_meta_id,
+            CASE WHEN min(dnb_meta.translit_len, gaz_meta.translit_len) <
+                      max(dnb_meta.translit_len, gaz_meta.translit_len) * (5 * :threshold - 4) THEN NULL
+                 WHEN dnb_meta.pref_name_tl = gaz_meta.pref_title_tl THEN 1.0
+                 ELSE jaro_winkler(dnb_meta.pref_name_tl, gaz_meta.pref_title_tl)
+            END AS jw
+        FROM
+            dnb_meta
+        INNER JOIN gaz_meta
+            ON (gaz_meta.translit_prefix >= dnb_meta.translit_prefix
+                AND gaz_meta.translit_prefix < dnb_meta.translit_prefix || char(1114111)
+                OR gaz_meta.translit_prefix IN (substr(dnb_meta.translit_prefix, 1, 1),
+                                               substr(dnb_meta.translit_prefix, 1, 2),
+                                               substr(dnb_meta.translit_prefix, 1, 3)))
+            AND gaz_meta.translit_len > 0
+        WHERE dnb_meta.translit_len > 0 AND dnb_meta.id % :shards = :shard
+    )
+    WHERE jw >= :threshold
+"""
+
+SQL_SELECT_FUZZY_NAME = """
+    SELECT dnb_name_id, gaz_name_id, jw FROM (
+        SELECT
+            dnb_name.id AS dnb_name_id,
+            gaz_name.id AS gaz_name_id,
+            CASE WHEN min(dnb_name.translit_len, gaz_name.translit_len) <
+                      max(dnb_name.translit_len, gaz_name.translit_len) * (5 * :threshold - 4) THEN NULL
+                 WHEN dnb_name.var_name_tl = gaz_name.title_tl THEN 1.0
+                 ELSE jaro_winkler(dnb_name.var_name_tl, gaz_name.title_tl)
+            END AS jw
+        FROM
+            dnb_name
+        INNER JOIN gaz_name
+            ON (gaz_name.translit_prefix >= dnb_name.translit_prefix
+                AND gaz_name.translit_prefix < dnb_name.translit_prefix || char(1114111)
+                OR gaz_name.translit_prefix IN (substr(dnb_name.translit_prefix, 1, 1),
+                                               substr(dnb_name.translit_prefix, 1, 2),
+                                               substr(dnb_name.translit_prefix, 1, 3)))
+            AND gaz_name.translit_len > 0
+        WHERE dnb_name.translit_len > 0 AND dnb_name.id % :shards = :shard
+    )
+    WHERE jw >= :threshold
+"""
+
+SQL_INSERT_FUZZY_META = "INSERT INTO fuzzy_meta (dnb_meta_id, gaz_meta_id, jarow) VALUES (?, ?, ?)"
+SQL_INSERT_FUZZY_NAME = "INSERT INTO fuzzy_name (dnb_name_id, gaz_name_id, jarow) VALUES (?, ?, ?)"
 
-def db_fuzzy_match_meta(con, threshold=0.8):
+
+def db_analyze(con):
     """
-    Performs fuzzy meta matching.
+    Updates the statistics of tables and indices for the query planner.
     """
-    logger.debug('starting fuzzy meta matching, this may take several hours ...')
+    logger.debug('analysing database ...')
+    cur = con.cursor()
+    cur.execute("ANALYZE")
+    con.commit()
+
+
+def db_block_meta(con):
+    """
+    Transliterates DNB and Gazetteer meta data once, and computes the
+    blocking keys (lower-case prefix and length of the transliterated name).
+    """
+    logger.debug('transliterating meta data ...')
     cur = con.cursor()
+    cur.execute("UPDATE dnb_meta SET pref_name_tl = translit(pref_name) WHERE pref_name_tl IS NULL")
+    cur.execute("UPDATE gaz_meta SET pref_title_tl = translit(pref_title) WHERE pref_title_tl IS NULL")
+
+    logger.debug('computing blocking keys of meta data ...')
     cur.execute("""
-        INSERT INTO fuzzy_meta(
-            dnb_meta_id, gaz_meta_id, jarow
-        ) SELECT
-            dnb_meta.id,
-            gaz_meta.id,
-            jaro_winkler(translit(dnb_meta.pref_name), translit(gaz_meta.pref_title)) AS jw
-        FROM
-            dnb_meta
-        CROSS JOIN gaz_meta
-        WHERE jw >= {:.5f}
-    """.format(threshold))
+        UPDATE dnb_meta SET
+            translit_prefix = lower(substr(pref_name_tl, 1, 4)),
+            translit_len    = length(pref_name_tl)
+    """)
+    cur.execute("""
+        UPDATE gaz_meta SET
+            translit_prefix = lower(substr(pref_title_tl, 1, 4)),
+            translit_len    = length(pref_title_tl)
+    """)
     con.commit()
 
 
-def db_fuzzy_match_names(con, threshold=0.8):
+def db_block_names(con):
     """
-    Performs fuzzy names matching.
+    Transliterates DNB and Gazetteer names once, and computes the blocking
+    keys (lower-case prefix and length of the transliterated name).
     """
-    logger.debug('starting fuzzy names matching, this may take several hours ...')
+    logger.debug('transliterating names ...')
     cur = con.cursor()
+    cur.execute("UPDATE dnb_name SET var_name_tl = translit(var_name) WHERE var_name_tl IS NULL")
+    cur.execute("UPDATE gaz_name SET title_tl = translit(title) WHERE title_tl IS NULL")
+
+    logger.debug('computing blocking keys of names ...')
     cur.execute("""
-        INSERT INTO fuzzy_name (
-            dnb_name_id, gaz_name_id, jarow
-        ) SELECT
-            dnb_name.id,
-            gaz_name.id,
-            jaro_winkler(translit(dnb_name.var_name), translit(gaz_name.title)) AS jw
-        FROM
-            dnb_name
-        CROSS JOIN gaz_name
-        WHERE jw >= {:.5f}
-    """.format(threshold))
+        UPDATE dnb_name SET
+            translit_prefix = lower(substr(var_name_tl, 1, 4)),
+            translit_len    = length(var_name_tl)
+    """)
+    cur.execute("""
+        UPDATE gaz_name SET
+            translit_prefix = lower(substr(title_tl, 1, 4)),
+            translit_len    = length(title_tl)
+    """)
     con.commit()
 
 
+def db_fuzzy_match(con, db_path, lib_path, select, insert, threshold=0.8, jobs=None):
+    """
+    Runs the fuzzy matching query `select` on `FUZZY_SHARDS` shards in up
+    to `jobs` worker processes, and writes the matches returned by the
+    workers with query `insert`. The workers only read from the database,
+    all matches are inserted through the given connection and committed
+    per shard. As the workers keep reading older snapshots, the WAL file
+    cannot be restarted while they run and may grow to a large share of
+    the match data; it is truncated once all workers have finished. If a
+    shard fails, pending shards are cancelled and the exception is
+    re-raised; the matches of finished shards remain in the database.
+    """
+    cur = con.cursor()
+    context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
+        futures = []
+
+        for shard in range(FUZZY_SHARDS):
+            params = {'threshold': threshold, 'shards': FUZZY_SHARDS, 'shard': shard}
+            futures.append(executor.submit(db_fuzzy_select, db_path, lib_path, select, params))
+
+        try:
+            for n, future in enumerate(as_completed(futures), start=1):
+                cur.executemany(insert, future.result())
+                con.commit()
+                logger.debug('finished shard {} of {}'.format(n, FUZZY_SHARDS))
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def db_fuzzy_match_meta(con, db_path, lib_path, threshold=0.8, jobs=None):
+    """
+    Performs fuzzy meta matching.
+
+    Only pairs with matching blocking keys are compared: the transliterated
+    names must be equal in their first four characters, or in all characters
+    of the shorter name, if it has less than four. Pairs that differ within
+    the first four characters are never compared, although they may reach
+    the threshold (for example, "Koeln" and "Coeln"). Identical names are
+    scored 1.0 without calling the Jaro-Winkler function.
+    """
+    db_block_meta(con)
+
+    logger.debug('starting fuzzy meta matching, this may take several hours ...')
+    db_fuzzy_match(con, db_path, lib_path, SQL_SELECT_FUZZY_META, SQL_INSERT_FUZZY_META,
+                   threshold, jobs)
+
+
+def db_fuzzy_match_names(con, db_path, lib_path, threshold=0.8, jobs=None):
+    """
+    Performs fuzzy names matching. Uses the same blocking as the meta
+    matching.
+    """
+    db_block_names(con)
+
+    logger.debug('starting fuzzy names matching, this may take several hours ...')
+    db_fuzzy_match(con, db_path, lib_path, SQL_SELECT_FUZZY_NAME, SQL_INSERT_FUZZY_NAME,
+                   threshold, jobs)
+
+
+def db_fuzzy_select(db_path, lib_path, select, params):
+    """
+    Returns the matches of query `select` for the shard given in `params`.
+    Runs in a worker process with its own database connection.
+    """
+    con = db_open(db_path, lib_path)
+    cur = con.cursor()
+    cur.execute(select, params)
+    rows = cur.fetchall()
+    con.close()
+    return rows
+
+
 def db_init(con):
     """
-    Initialises database connection and deletes stale data.
+    Initialises database connection, adds missing blocking columns and
+    indices, and deletes stale data.
     """
     db_pragma(con)
 
     cur = con.cursor()
+
+    for table, column in BLOCK_COLUMNS.items():
+        cur.execute("SELECT name FROM pragma_table_info(?)", (table,))
+        names = [row[0] for row in cur.fetchall()]
+
+        for name, decl in ((column, 'TEXT'), ('translit_prefix', 'TEXT'), ('translit_len', 'INTEGER')):
+            if name not in names:
+                logger.debug('adding column {} to table {} ...'.format(name, table))
+                cur.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, name, decl))
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_{0}_translit
+            ON {0} (translit_prefix, translit_len, {1})
+        """.format(table, column))
+
     cur.execute("DELETE FROM fuzzy_meta")
     cur.execute("DELETE FROM fuzzy_name")
     con.commit()
@@ -97,13 +287,13 @@ def db_open(db_path, lib_path):
 
 def db_pragma(con):
     """
-    Executes SQLite PRAGMA statements.
+    Executes SQLite PRAGMA statements. The database is switched to WAL mode,
+    to let worker processes read while matches are written.
     """
     cur = con.cursor()
-    cur.execute("PRAGMA journal_mode = OFF")
+    cur.execute("PRAGMA journal_mode = WAL")
     cur.execute("PRAGMA synchronous = 0")
     cur.execute("PRAGMA cache_size = 1000000")
-    cur.execute("PRAGMA locking_mode = EXCLUSIVE")
     cur.execute("PRAGMA temp_store = MEMORY")
     con.commit()
 
@@ -115,10 +305,11 @@ def parse_args():
     parser = ArgumentParser(description='Gazetteer and DNB fuzzy matching', exit_on_error=True)
 
     parser.add_argument('-i', '--input',     help='path to SQLite database file', required=True, type=Path)
+    parser.add_argument('-j', '--jobs',      help='number of worker processes (default: number of CPUs)', default=os.cpu_count(), type=int)
     parser.add_argument('-l', '--library',   help='path to sqlean fuzzy extension library', default='./fuzzy')
     parser.add_argument('-m', '--meta',      help='match meta data', action='store_true')
     parser.add_argument('-n', '--names',     help='match name data', action='store_true')
-    parser.add_argumnet('-t', '--threshold', help='Jaro-Winkler threshold value (default: 0.8)', default=0.8, type=float)
+    parser.add_argument('-t', '--threshold', help='Jaro-Winkler threshold value (default: 0.8)', default=0.8, type=float)
     parser.add_argument('-v', '--verbose',   help='increase output verbosity', action='store_true')
 
     args = parser.parse_args()
@@ -153,8 +344,10 @@ if __name__ == '__main__':
 
     if (args.meta):
         logger.info('matching DNB and Gazetteer meta titles ...')
-        db_fuzzy_match_meta(con, args.threshold)
+        db_fuzzy_match_meta(con, args.input, args.library, args.threshold, args.jobs)
 
     if (args.names):
         logger.info('matching DNB and Gazetteer names ...')
-        db_fuzzy_match_names(con, args.threshold)
+        db_fuzzy_match_names(con, args.input, args.library, args.threshold, args.jobs)
+
+    db_analyze(con)
@@ -25,6 +25,15 @@ from pathlib import Path
 
 logger = logging.getLogger('main')
 
+# Translation table to escape HTML special characters, like html.escape().
+tbl_escape = str.maketrans({
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '"': '&quot;',
+    "'": '&#x27;'
+})
+
 tpl_header = """<!DOCTYPE html>
 <html lang="en">
 <head>
@@ -42,6 +51,10 @@ $thead
 <tbody>
 """
 
+tpl_thead_dnb = '<thead><tr><th>DNB ID</th><th>Pref. Name</th><th>Gaz ID</th></tr></thead>'
+
+tpl_thead_gaz = '<thead><tr><th>Gaz ID</th><th>Pref. Title</th><th>Pref. Lang.</th></tr></thead>'
+
 tpl_footer = """</tbody>
 </table>
 <hr>
@@ -71,33 +84,30 @@ def html_dnb(db_path, html_path, css='style.css', limit=100, title='DNB'):
 
     today = datetime.now()
 
-    with open(html_path, 'w') as fh:
-        thead = '<thead><tr><th>DNB ID</th><th>Pref. Name</th><th>Gaz ID</th></tr></thead>'
-        fh.write(th.substitute(
-            {
-                'title': title,
-                'css': css,
-                'thead': thead
-            }
-        ))
-
-        cur.execute(
-            """
-            SELECT dnb_id, pref_name, owl_gnd FROM dnb_meta ORDER BY dnb_id ASC LIMIT ?
-            """, (limit, )
-        )
-        rows = cur.fetchall()
+    cur.execute(
+        """
+        SELECT dnb_id, pref_name, owl_gnd FROM dnb_meta ORDER BY dnb_id ASC LIMIT ?
+        """, (limit, )
+    )
 
-        html_row = '<tr><td>{}</td><td>{}</td><td>{}</td></tr>\n'
-        n = 0
+    rows = [
+        f'<tr><td>{str(dnb_id).translate(tbl_escape)}</td>'
+        f'<td>{str(pref_name).translate(tbl_escape)}</td>'
+        f'<td>{str(owl_gnd).translate(tbl_escape)}</td></tr>\n'
+        for dnb_id, pref_name, owl_gnd in cur
+    ]
 
-        for row in rows:
-            n = n + 1
-            line = html_row.format(row[0], row[1], row[2])
-            logger.debug('Writing row ({}) ...'.format(n))
-            fh.write(line)
+    page = th.substitute(
+        {
+            'title': title,
+            'css': css,
+            'thead': tpl_thead_dnb
+        }
+    ) + ''.join(rows) + tf.substitute({'dt': today.isoformat()})
 
-        fh.write(tf.substitute({'dt': today.isoformat()}))
+    # Encode the page at once and bypass the text layer.
+    with open(html_path, 'wb') as fh:
+        fh.write(page.encode('utf-8'))
 
 
 def html_gaz(db_path, html_path, css='style.css', limit=100, title='Gazetteer'):
@@ -120,33 +130,30 @@ def html_gaz(db_path, html_path, css='style.css', limit=100, title='Gazetteer'):
 
     today = datetime.now()
 
-    with open(html_path, 'w') as fh:
-        thead = '<thead><tr><th>Gaz ID</th><th>Pref. Title</th><th>Pref. Lang.</th></tr></thead>'
-        fh.write(th.substitute(
-            {
-                'title': title,
-                'css': css,
-                'thead': thead
-            }
-        ))
-
-        cur.execute(
-            """
-            SELECT gaz_id, pref_title, pref_lang FROM gaz_meta ORDER BY gaz_id ASC LIMIT ?
-            """, (limit, )
-        )
-        rows = cur.fetchall()
-
-        html_row = '<tr><td>{}</td><td>{}</td><td>{}</td></tr>\n'
-        n = 0
-
-        for row in rows:
-            n = n + 1
-            line = html_row.format(row[0], row[1], row[2])
-            logger.debug('Writing row ({}) ...'.format(n))
-            fh.write(line)
-
-        fh.write(tf.substitute({'dt': today.isoformat()}))
+    cur.execute(
+        """
+        SELECT gaz_id, pref_title, pref_lang FROM gaz_meta ORDER BY gaz_id ASC LIMIT ?
+        """, (limit, )
+    )
+
+    rows = [
+        f'<tr><td>{str(gaz_id).translate(tbl_escape)}</td>'
+        f'<td>{str(pref_title).translate(tbl_escape)}</td>'
+        f'<td>{str(pref_lang).translate(tbl_escape)}</td></tr>\n'
+        for gaz_id, pref_title, pref_lang in cur
+    ]
+
+    page = th.substitute(
+        {
+            'title': title,
+            'css': css,
+            'thead': tpl_thead_gaz
+        }
+    ) + ''.join(rows) + tf.substitute({'dt': today.isoformat()})
+
+    # Encode the page at once and bypass the text layer.
+    with open(html_path, 'wb') as fh:
+        fh.write(page.encode('utf-8'))
 
 
 def parse_args():
@@ -13,7 +13,6 @@ $ python3 import.py --dnb dnb.json --output database.sqlite --schema schema.sql
 ```
 """
 
-import ijson
 import logging
 import simplejson as json
 import sqlite3
@@ -22,8 +21,67 @@ import sys
 from argparse import ArgumentParser, FileType
 from pathlib import Path
 
+# Use the C backend of ijson, if available.
+try:
+    import ijson.backends.yajl2_c as ijson
+except ImportError:
+    import ijson
+
 logger = logging.getLogger('main')
 
+# Owl same-as identifiers as tuples of prefix, prefix length, and column name,
+# indexed by the first OWL_HEAD_LEN characters of the prefix, which have to be
+# unique.
+OWL_HEAD_LEN = 12
+OWL_IDENTS = {prefix[:OWL_HEAD_LEN]: (prefix, len(prefix), column) for prefix, column in (
+    ('https://d-nb.info/gnd/',          'owl_gnd'),
+    ('http://viaf.org/viaf/',           'owl_viaf'),
+    ('http://www.wikidata.org/entity/', 'owl_wikidata'),
+    ('https://sws.geonames.org/',       'owl_geonames'),
+    ('http://id.loc.gov/rwo/agents/',   'owl_loc'),
+)}
+
+# Number of DNB or Gazetteer objects to insert per batch.
+BATCH_SIZE = 5000
+
+# Prepared statements.
+SQL_INSERT_DNB_META = """
+    INSERT INTO dnb_meta (
+        id,
+        dnb_id,
+        pref_name,
+        owl_geonames,
+        owl_gnd,
+        owl_loc,
+        owl_viaf,
+        owl_wikidata
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_INSERT_DNB_NAME = """
+    INSERT INTO dnb_name (
+        dnb_meta_id, var_name
+    ) VALUES (?, ?)
+"""
+
+# Splits old authority numbers of the form "(prefix)gnd_id".
+SQL_INSERT_DNB_OLD_AUTH = """
+    INSERT INTO dnb_old_auth (
+        dnb_meta_id, number, prefix, gnd_id
+    ) SELECT
+        dnb_meta_id,
+        number,
+        CASE WHEN substr(number, 1, 1) = '(' AND instr(number, ')') > 2
+             THEN substr(number, 2, instr(number, ')') - 2)
+        END,
+        CASE WHEN substr(number, 1, 1) = '(' AND instr(number, ')') > 2
+             THEN substr(number, instr(number, ')') + 1)
+        END
+    FROM (SELECT ? AS dnb_meta_id, ? AS number)
+"""
+
+SQL_INSERT_GAZ_RAW = "INSERT INTO gaz_raw_view (raw) VALUES (?)"
+
 
 def db_create_schema(db_path, sql_path):
     """
@@ -36,69 +94,79 @@ def db_create_schema(db_path, sql_path):
 
     with open(sql_path, 'r') as sql_file:
         cur = con.cursor()
+        # Has no effect on existing databases.
+        cur.execute("PRAGMA page_size = 32768")
         cur.executescript(sql_file.read())
         con.commit()
 
 
-def db_import_dnb(con, dnb_id, pref_name, owl_geonames, owl_gnd, owl_loc,
-                  owl_viaf, owl_wikidata, var_names=[], old_auths=[]):
+def db_commit_dnb(cur, metas, var_names, old_auths, n):
     """
-    Imports DNB data.
+    Imports pending DNB meta data, variant names, and old authority
+    numbers, commits the current transaction, and clears all lists. The
+    batch ends with object `n`. On integrity errors, the whole batch is
+    rolled back and the error is re-raised.
     """
-    cur = con.cursor()
-    cur.execute("""
-        INSERT INTO dnb_meta (
-            dnb_id,
-            pref_name,
-            owl_geonames,
-            owl_gnd,
-            owl_loc,
-            owl_viaf,
-            owl_wikidata
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (dnb_id, pref_name, owl_geonames, owl_gnd, owl_loc, owl_viaf, owl_wikidata))
-    con.commit()
+    try:
+        db_import_dnb(cur, metas)
+        db_import_dnb_names(cur, var_names)
+        db_import_dnb_old_auths(cur, old_auths)
+        cur.connection.commit()
+    except sqlite3.IntegrityError as e:
+        logger.error('failed to import dnb objects {} to {}: {}'.format(n - len(metas) + 1, n, str(e)))
+        cur.connection.rollback()
+        raise
 
-    if var_names and len(var_names) > 0:
-        cur.executemany("""
-            INSERT INTO dnb_name (
-                dnb_meta_id, var_name
-            ) VALUES ((SELECT id FROM dnb_meta WHERE dnb_id = ?), ?)
-            """, var_names)
-        con.commit()
+    metas.clear()
+    var_names.clear()
+    old_auths.clear()
 
-    if old_auths and len(old_auths) > 0:
-        values = []
 
-        for dnb_id, value in old_auths:
-            prefix = None
-            gnd_id = None
+def db_import_dnb(cur, metas):
+    """
+    Imports DNB meta data, given as list of tuples of row id, DNB id,
+    preferred name, and owl identifiers. The transaction is not committed.
+    """
+    if not metas: return
+    cur.executemany(SQL_INSERT_DNB_META, metas)
 
-            i = value.find('(')
-            j = value.find(')')
 
-            if i == 0 and j > 1:
-                prefix = value[i + 1:j]
-                gnd_id = value[j + 1:]
+def db_import_dnb_names(cur, var_names):
+    """
+    Imports DNB variant names, given as list of `(dnb_meta_id, var_name)`
+    tuples. The transaction is not committed.
+    """
+    if not var_names: return
+    cur.executemany(SQL_INSERT_DNB_NAME, var_names)
 
-            values.append((dnb_id, value, prefix, gnd_id, ))
 
-        cur.executemany("""
-            INSERT INTO dnb_old_auth (
-                dnb_meta_id, number, prefix, gnd_id
-            ) VALUES ((SELECT id FROM dnb_meta WHERE dnb_id = ?), ?, ?, ?)
-            """, values)
-        con.commit()
+def db_import_dnb_old_auths(cur, old_auths):
+    """
+    Imports DNB old authority numbers, given as list of
+    `(dnb_meta_id, number)` tuples. Prefix and GND id are extracted by
+    SQLite. The transaction is not committed.
+    """
+    if not old_auths: return
+    cur.executemany(SQL_INSERT_DNB_OLD_AUTH, old_auths)
 
 
-def db_import_gaz(con, json):
+def db_import_gaz(cur, values, n):
     """
-    Writes single JSON object into SQLite table view which will activate
-    an INSTEAD OF INSERT trigger.
+    Writes JSON objects, given as list of 1-tuples, into SQLite table view
+    which will activate an INSTEAD OF INSERT trigger. Commits the
+    transaction and clears the list. The batch ends with object `n`. On
+    integrity errors, the whole batch is rolled back and the error is
+    re-raised.
     """
-    cur = con.cursor()
-    cur.execute("INSERT INTO gaz_raw_view (raw) VALUES (json(?))", (json, ))
-    con.commit()
+    try:
+        cur.executemany(SQL_INSERT_GAZ_RAW, values)
+        cur.connection.commit()
+    except sqlite3.IntegrityError as e:
+        logger.error('failed to import gaz objects {} to {}: {}'.format(n - len(values) + 1, n, str(e)))
+        cur.connection.rollback()
+        raise
+
+    values.clear()
 
 
 def db_open(db_path):
@@ -125,6 +193,7 @@ def db_pragma(con):
     cur.execute("PRAGMA cache_size = 1000000")
     cur.execute("PRAGMA locking_mode = EXCLUSIVE")
     cur.execute("PRAGMA temp_store = MEMORY")
+    cur.execute("PRAGMA mmap_size = 30000000000")
     con.commit()
 
 
@@ -154,34 +223,33 @@ def json_import_dnb(json_path, db_path, old_auth=False):
     old_auths_key = 'https://d-nb.info/standards/elementset/gnd#oldAuthorityNumber'
 
     # Identifiers.
-    dnb_ident          = 'https://d-nb.info/gnd/'
-    owl_geonames_ident = 'https://sws.geonames.org/'
-    owl_gnd_ident      = 'https://d-nb.info/gnd/'
-    owl_loc_ident      = 'http://id.loc.gov/rwo/agents/'
-    owl_viaf_ident     = 'http://viaf.org/viaf/'
-    owl_wikidata_ident = 'http://www.wikidata.org/entity/'
+    dnb_ident = 'https://d-nb.info/gnd/'
 
     con = db_open(db_path)
     if not con: return
 
-    logger.debug('reading JSON-LD file "{}" ...'.format(json_path))
+    logger.debug('reading JSON-LD file "{}" with ijson backend {} ...'.format(json_path, ijson.backend))
 
-    with open(json_path, 'r') as json_file:
+    # Meta data, variant names, and old authority numbers pending import.
+    dnb_metas     = []
+    dnb_names     = []
+    dnb_old_auths = []
+
+    with open(json_path, 'rb') as json_file:
         # Read array objects as stream.
-        objects = ijson.items(json_file, 'item.item')
+        objects = ijson.items(json_file, 'item.item', use_float=True)
+        cur = con.cursor()
         n = 0
 
+        # Row ids of new meta data are assigned in advance, to reference
+        # them in names and old authority numbers of the same batch.
+        cur.execute("SELECT coalesce(max(id), 0) FROM dnb_meta")
+        dnb_meta_id = cur.fetchone()[0]
+
         # Parse each object.
         for obj in objects:
-            gnd_id       = None
-            owl_viaf     = None
-            owl_wikidata = None
-            owl_loc      = None
-            owl_gnd      = None
-            owl_geonames = None
-            pref_name    = None
-            var_names    = None
-            old_auths    = None
+            owl       = {}
+            pref_name = None
 
             # Get @id value.
             obj_id = obj.get('@id')
@@ -205,20 +273,13 @@ def json_import_dnb(json_path, db_path, old_auth=False):
                     owl_value = owl_obj.get('@id')
                     if not owl_value: continue
 
-                    if owl_value.startswith(owl_geonames_ident):
-                        owl_geonames = owl_value[len(owl_geonames_ident):]
+                    owl_ident = OWL_IDENTS.get(owl_value[:OWL_HEAD_LEN])
+                    if not owl_ident: continue
 
-                    if owl_value.startswith(owl_gnd_ident):
-                        owl_gnd = owl_value[len(owl_gnd_ident):]
+                    prefix, prefix_len, column = owl_ident
 
-                    if owl_value.startswith(owl_loc_ident):
-                        owl_loc = owl_value[len(owl_loc_ident):]
-
-                    if owl_value.startswith(owl_viaf_ident):
-                        owl_viaf = owl_value[len(owl_viaf_ident):]
-
-                    if owl_value.startswith(owl_wikidata_ident):
-                        owl_wikidata = owl_value[len(owl_wikidata_ident):]
+                    if owl_value.startswith(prefix):
+                        owl[column] = owl_value[prefix_len:]
 
             # Get preferred name.
             pref_list = obj.get(pref_name_key, [])
@@ -226,45 +287,43 @@ def json_import_dnb(json_path, db_path, old_auth=False):
             if len(pref_list) > 0:
                 pref_name = pref_list[0].get('@value')
 
-            # Get variant names.
-            var_list = obj.get(var_names_key, [])
-
-            if len(var_list) > 0:
-                var_names = []
+            logger.debug('importing dnb id {} ({}) ...'.format(dnb_id, n))
+            dnb_meta_id = dnb_meta_id + 1
+            dnb_metas.append((dnb_meta_id,
+                              dnb_id,
+                              pref_name,
+                              owl.get('owl_geonames'),
+                              owl.get('owl_gnd'),
+                              owl.get('owl_loc'),
+                              owl.get('owl_viaf'),
+                              owl.get('owl_wikidata'), ))
 
-                for var_obj in var_list:
-                    value = var_obj.get('@value')
-                    if not value: continue
-                    var_names.append((dnb_id, value, ))
+            # Get variant names.
+            for var_obj in obj.get(var_names_key, []):
+                value = var_obj.get('@value')
+                if not value: continue
+                dnb_names.append((dnb_meta_id, value, ))
 
             if old_auth:
                 # Get old authority numbers.
-                var_list = obj.get(old_auths_key, [])
-
-                if len(var_list) > 0:
-                    old_auths = []
+                for var_obj in obj.get(old_auths_key, []):
+                    value = var_obj.get('@value')
+                    if not value: continue
+                    dnb_old_auths.append((dnb_meta_id, value, ))
 
-                    for var_obj in var_list:
-                        value = var_obj.get('@value')
-                        if not value: continue
-                        old_auths.append((dnb_id, value, ))
+            n = n + 1
 
             # Write to database.
-            try:
-                logger.debug('importing dnb id {} ({}) ...'.format(dnb_id, n))
-                db_import_dnb(con,
-                              dnb_id,
-                              pref_name,
-                              owl_geonames, owl_gnd, owl_loc, owl_viaf, owl_wikidata,
-                              var_names,
-                              old_auths)
-                n = n + 1
-                if n % 10000 == 0: logger.info('imported {} objects into "{}"'.format(n, db_path))
-            except sqlite3.IntegrityError:
-                logger.warning('dnb id {} already exists'.format(dnb_id))
+            if n % BATCH_SIZE == 0:
+                db_commit_dnb(cur, dnb_metas, dnb_names, dnb_old_auths, n)
+
+            if n % 10000 == 0: logger.info('imported {} objects into "{}"'.format(n, db_path))
 
+        db_commit_dnb(cur, dnb_metas, dnb_names, dnb_old_auths, n)
         logger.info('imported {} objects into "{}"'.format(n, db_path))
 
+    con.close()
+
 
 def json_import_gaz(json_path, db_path):
     """
@@ -273,10 +332,14 @@ def json_import_gaz(json_path, db_path):
     con = db_open(db_path)
     if not con: return
 
-    logger.debug('reading JSON file "{}" ...'.format(json_path))
+    logger.debug('reading JSON file "{}" with ijson backend {} ...'.format(json_path, ijson.backend))
 
-    with open(json_path, 'r') as json_file:
-        objects = ijson.items(json_file, 'item')
+    with open(json_path, 'rb') as json_file:
+        # Numbers are parsed as float, as Decimal objects are expensive to
+        # encode, and are never compared by value.
+        objects = ijson.items(json_file, 'item', use_float=True)
+        cur = con.cursor()
+        raws = []
         n = 0
 
         for obj in objects:
@@ -286,18 +349,21 @@ def json_import_gaz(json_path, db_path):
                 logger.warning('object has no gazId')
                 continue
 
-            raw = json.dumps(obj, use_decimal=True)
+            logger.debug('importing gaz id {} ({}) ...'.format(gaz_id, n))
+            # Compact JSON, which does not have to be validated by SQLite.
+            raws.append((json.dumps(obj, ensure_ascii=False, separators=(',', ':')), ))
+            n = n + 1
 
-            try:
-                logger.debug('importing gaz id {} ({}) ...'.format(gaz_id, n))
-                db_import_gaz(con, raw)
-                n = n + 1
-                if n % 10000 == 0: logger.info('imported {} objects into "{}"'.format(n, db_path))
-            except sqlite3.IntegrityError:
-                logger.warning('gaz id {} already exists'.format(gaz_id))
+            if n % BATCH_SIZE == 0:
+                db_import_gaz(cur, raws, n)
 
+            if n % 10000 == 0: logger.info('imported {} objects into "{}"'.format(n, db_path))
+
+        db_import_gaz(cur, raws, n)
         logger.info('imported {} objects into "{}"'.format(n, db_path))
 
+    con.close()
+
 
 def parse_args():
     """
@@ -355,4 +421,7 @@ if __name__ == '__main__':
             json_import_gaz(json_path=args.gaz, db_path=args.output)
     except FileNotFoundError:
         logger.error('input file or schema not found')
+    except sqlite3.IntegrityError:
+        logger.error('import aborted, previous batches have been committed')
+        sys.exit(1)
 
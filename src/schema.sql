@@ -16,10 +16,13 @@ CREATE VIEW IF NOT EXISTS gaz_raw_view AS SELECT * FROM gaz_raw;
 
 -- Gazetteer name data.
 CREATE TABLE IF NOT EXISTS gaz_name (
-    id          INTEGER PRIMARY KEY,
-    gaz_id      INTEGER NOT NULL,
-    title       TEXT,
-    lang        TEXT
+    id              INTEGER PRIMARY KEY,
+    gaz_id          INTEGER NOT NULL,
+    title           TEXT,
+    lang            TEXT,
+    title_tl        TEXT,    -- Transliterated title, set by fuzzy.py
+    translit_prefix TEXT,    -- Blocking key, set by fuzzy.py
+    translit_len    INTEGER  -- Blocking key, set by fuzzy.py
 );
 
 -- Additional indices.
@@ -43,6 +46,9 @@ CREATE TABLE IF NOT EXISTS gaz_ident_gnd (
     gnd_id      TEXT
 );
 
+-- Covering index for the export joins.
+CREATE INDEX IF NOT EXISTS idx_gaz_ident_gnd_gaz_id ON gaz_ident_gnd (gaz_id, gnd_id);
+
 -- Zenon System Nr.
 CREATE TABLE IF NOT EXISTS gaz_ident_zenon_systemnr (
     id          INTEGER PRIMARY KEY,
@@ -59,10 +65,13 @@ CREATE TABLE IF NOT EXISTS gaz_ident_zenon_thesaurus (
 
 -- Gazetteer meta data.
 CREATE TABLE IF NOT EXISTS gaz_meta (
-    id          INTEGER PRIMARY KEY,
-    gaz_id      INTEGER NOT NULL,
-    pref_title  TEXT,
-    pref_lang   TEXT
+    id              INTEGER PRIMARY KEY,
+    gaz_id          INTEGER NOT NULL,
+    pref_title      TEXT,
+    pref_lang       TEXT,
+    pref_title_tl   TEXT,    -- Transliterated title, set by fuzzy.py
+    translit_prefix TEXT,    -- Blocking key, set by fuzzy.py
+    translit_len    INTEGER  -- Blocking key, set by fuzzy.py
 );
 
 -- Additional indices.
@@ -167,14 +176,20 @@ CREATE TABLE IF NOT EXISTS dnb_meta (
     owl_gnd         TEXT,
     owl_loc         TEXT,
     owl_viaf        INTEGER,
-    owl_wikidata    TEXT
+    owl_wikidata    TEXT,
+    pref_name_tl    TEXT,    -- Transliterated name, set by fuzzy.py
+    translit_prefix TEXT,    -- Blocking key, set by fuzzy.py
+    translit_len    INTEGER  -- Blocking key, set by fuzzy.py
 );
 
 -- variantNameForThePlaceOrGeographicName
 CREATE TABLE IF NOT EXISTS dnb_name (
-    id          INTEGER PRIMARY KEY,
-    dnb_meta_id INTEGER NOT NULL,
-    var_name    TEXT,
+    id              INTEGER PRIMARY KEY,
+    dnb_meta_id     INTEGER NOT NULL,
+    var_name        TEXT,
+    var_name_tl     TEXT,    -- Transliterated name, set by fuzzy.py
+    translit_prefix TEXT,    -- Blocking key, set by fuzzy.py
+    translit_len    INTEGER, -- Blocking key, set by fuzzy.py
     FOREIGN KEY (dnb_meta_id) REFERENCES dnb_meta(id)
 );
 
@@ -205,6 +220,9 @@ CREATE TABLE IF NOT EXISTS fuzzy_meta (
     FOREIGN KEY (gaz_meta_id) REFERENCES gaz_meta(id)
 );
 
+-- Best matches of each DNB record first.
+CREATE INDEX IF NOT EXISTS idx_fuzzy_meta_dnb_meta_id ON fuzzy_meta (dnb_meta_id, jarow DESC);
+
 --
 -- Fuzzy name matches.
 --